@@ -2,8 +2,29 @@
 
 import os
 import json
+from functools import lru_cache
 from typing import Dict, Any
 
+
+@lru_cache(maxsize=None)
+def read_config_file(file_path: str) -> Dict[str, Any]:
+    """
+    Reads and parses a JSON configuration file, memoized per path.
+
+    A single command creates several ConfigManager instances, e.g. through TapeOperations
+    and TapeLibraryOperations, so the file is read and parsed only once per process. The
+    returned dictionary is shared and must not be modified.
+
+    Args:
+        file_path (str): The path to the configuration file.
+
+    Returns:
+        Dict[str, Any]: A dictionary representation of the configuration file.
+    """
+    with open(file_path, 'r') as file:
+        return json.load(file)
+
+
 class ConfigManager:
     """
     A class for managing configuration files for the tape backup system.
@@ -41,8 +62,7 @@ class ConfigManager:
             Dict[str, Any]: A dictionary representation of the configuration file.
         """
         try:
-            with open(file_path, 'r') as file:
-                return json.load(file)
+            return read_config_file(os.path.realpath(file_path))
         except Exception as e:
             print(f"Error loading config: {e}")
             return {}
@@ -120,7 +140,8 @@ class ConfigManager:
         Retrieve the temporary tar directory path from the default configuration.
 
         Returns:
-            str: The path to the temporary tar directory.
+            str or list: The path to the temporary tar directory, or a list of paths to spread the
+                         tar files across several file systems.
         """
         return self.config.get('tar_dir', '.')
     
@@ -1,15 +1,24 @@
 # tape_backup.py
+import heapq
+import logging
 import os
-import tempfile
+import queue
 import subprocess
+import sys
 import threading
 import typer
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain, islice
 from rich.progress import Progress
 
 from pytp.tape_metadata import TapeMetadata
 from pytp.tape_library_operations import TapeLibraryOperations
 
+logger = logging.getLogger(__name__)
+
+FS_ENCODING      = sys.getfilesystemencoding()
+LIST_WRITE_BATCH = 65536  # Paths joined per write when creating a list file for tar
+
 class TapeBackup:
     """
     The TapeBackup class provides functionalities to backup directories to a tape drive.
@@ -26,23 +35,32 @@ class TapeBackup:
         max_concurrent_tars         (int): Stores the maximum number of tar files that can be generated concurrently.
         memory_buffer               (int): The size of the memory buffer to be used for tar and dd operations.
         memory_buffer_percent       (int): The percentage the memory buffer needs to be filled before streaming to tape.
-        tar_dir                     (str): Stores the path of the directory for tar files.
+        read_block_size             (str): The size dd reads the tar file in with the dd strategy; writes use block_size.
+        tar_dirs                   (list): Stores the paths of the directories for tar files; tar files are spread across them.
+        tar_dir                     (str): Stores the path of the first directory for tar files, which also holds the log file.
         snapshot_dir                (str): Stores the path of the directory for snapshot files.
         library_name                (str): Stores the name of the tape library.
         label                       (str): Stores the label of the tape.
         job                         (str): Stores the job name of the backup.
         strategy                    (str): Stores the backup strategy to be used (direct or tar (via memory buffer), or dd (without memory buffer)).
         incremental                (bool): Flag to indicate whether incremental backup is enabled.
-        all_tars_generated         (bool): Flag to indicate whether all tar files have been generated.
-        tars_to_be_generated       (list): List to keep track of tar files that need to be generated.
-        tars_generating             (set): Set to keep track of tar files currently being generated.
-        tars_generated             (list): List to keep track of generated tar files, maintaining their order.
-        tars_to_write              (list): List of tar files that are ready to be written to the tape.
-        generating_lock  (threading.Lock): Lock to manage concurrent access to tars_generating.
-        generated_lock   (threading.Lock): Lock to manage concurrent access to tars_generated.
-        to_write_lock    (threading.Lock): Lock to manage concurrent access to tars_to_write.
+        write_to_tape          (callable): Writes a tar file to tape; write_to_tape_dd with the dd strategy, otherwise write_to_tape_tar.
+        next_tar_index              (int): Index of the next tar file to be queued for writing to tape.
+        tar_futures                (dict): Maps the future of each tar generation task to its tar path.
+        tars_generated             (list): Min-heap of (index, tar path) for finished tar files that wait for their
+                                           predecessors; the tar path is None for a skipped directory.
+        tars_to_write       (queue.Queue): Bounded queue of tar files that are ready to be written to the tape, ended by None.
+        generated_lock   (threading.Lock): Lock to manage concurrent access to tars_generated and next_tar_index.
+        disk_tokens                 (int): Number of further tar files that may be staged in the tar directories; one is
+                                           taken before a tar file is generated and returned once it has been removed.
+        disk_token_turn             (int): Index of the next directory allowed to take a disk token.
+        disk_token_condition (threading.Condition): Guards disk_tokens and disk_token_turn, and signals changes to them.
+        dd_log_path                 (str): Path of the log file for the tape writes, in the tar directory.
+        dd_log                     (file): The log file for the tape writes, line buffered and open while a tar backup runs.
+        unlink_queue  (queue.SimpleQueue): Tar files written to tape, to be removed by the unlink thread, ended by None.
+        unlink_thread  (threading.Thread): Thread removing the tar files from unlink_queue, while a tar backup runs.
+        children                    (set): The tar, mbuffer and dd processes currently running, stopped by exit_handler.
         running                    (bool): Flag to control the running state of the backup process.
-        semaphore   (threading.Semaphore): Semaphore to control the number of concurrent tar file generation operations.
         progress (rich.progress.Progress): Progress bar to monitor the backup process.
         metadata           (TapeMetadata): TapeMetadata instance to manage metadata operations.
         tar_to_directory_mapping   (dict): Maps tar paths to their directories.
@@ -55,7 +73,7 @@ class TapeBackup:
     STRATEGY_TAR    = 'tar'    # creates tar files first, then writes to tape, using memory buffer
     STRATEGY_DD     = 'dd'     # creates tar files first, then writes to tape using dd, without memory buffer
 
-    def __init__(self, tape_operations, device_path, block_size, tar_dir, snapshot_dir, library_name = None, label = None, job = None, strategy = "direct", incremental = False, max_concurrent_tars = 2, memory_buffer = 6, memory_buffer_percent = 40):
+    def __init__(self, tape_operations, device_path, block_size, tar_dir, snapshot_dir, library_name = None, label = None, job = None, strategy = "direct", incremental = False, max_concurrent_tars = 2, memory_buffer = 6, memory_buffer_percent = 40, read_block_size = "16M"):
         """
         Initializes the TapeBackup class.
 
@@ -63,7 +81,9 @@ class TapeBackup:
             tape_operations (TapeOperations): The TapeOperations instance used for tape operations.
             device_path                (str): The path to the tape drive device.
             block_size                 (int): The block size to be used for tar and dd operations.
-            tar_dir                    (str): The root directory where tar files will be stored.
+            tar_dir            (str or list): The root directory where tar files will be stored, or a list of them. With a
+                                              list, consecutive tar files go to consecutive directories, which spreads
+                                              concurrent tar generation across file systems.
             max_concurrent_tars        (int): The maximum number of concurrent tar operations.
             strategy                   (str): The backup strategy to be used (direct, tar, or dd).
             library_name               (str): The name of the tape library.
@@ -71,6 +91,7 @@ class TapeBackup:
             job                        (str): The job name of the backup.
             memory_buffer              (int): The size of the memory buffer to be used for tar and dd operations.
             memory_buffer_percent      (int): The percentage the memory buffer needs to be filled before streaming to tape.
+            read_block_size            (str): The size dd reads the tar file in with the dd strategy, e.g. "16M".
         """
         self.tape_operations       = tape_operations    
         self.device_path           = device_path
@@ -78,7 +99,9 @@ class TapeBackup:
         self.max_concurrent_tars   = max_concurrent_tars
         self.memory_buffer         = f"{memory_buffer}G"
         self.memory_buffer_percent = memory_buffer_percent
-        self.tar_dir               = tar_dir
+        self.read_block_size       = read_block_size
+        self.tar_dirs              = [tar_dir] if isinstance(tar_dir, str) else list(tar_dir)
+        self.tar_dir               = self.tar_dirs[0]
         self.snapshot_dir          = snapshot_dir
         self.library_name          = library_name
         self.label                 = label
@@ -93,26 +116,31 @@ class TapeBackup:
         self.job                   = job
         self.strategy              = strategy
         self.incremental           = incremental
-        self.all_tars_generated    = False
-        self.tars_to_be_generated  = []
-        self.tars_generating       = set()
+        self.write_to_tape         = self.write_to_tape_dd if strategy == self.STRATEGY_DD else self.write_to_tape_tar
+        self.next_tar_index        = 0
+        self.tar_futures           = {}
         self.tars_generated        = []
-        self.tars_to_write         = []
-        self.generating_lock       = threading.Lock()
+        self.tars_to_write         = queue.Queue(maxsize=max_concurrent_tars)
         self.generated_lock        = threading.Lock()
-        self.to_write_lock         = threading.Lock()
+        self.disk_tokens           = max_concurrent_tars
+        self.disk_token_turn       = 0
+        self.disk_token_condition  = threading.Condition()
+        self.dd_log_path           = os.path.join(self.tar_dir, "dd_output.log")
+        self.dd_log                = None
+        self.unlink_queue          = queue.SimpleQueue()
+        self.unlink_thread         = None
+        self.children              = set()
         self.running               = True
-        self.semaphore             = threading.Semaphore(max_concurrent_tars)
         self.progress              = Progress()
         self.metadata              = TapeMetadata(tape_operations=self.tape_operations, progress = self.progress, snapshot_dir=self.snapshot_dir, label=self.label, strategy=self.strategy, block_size=self.block_size, job=self.job)
         self.tar_to_directory_mapping = {}  # Maps tar paths to their directories
 
 
-    def generate_tar_file(self, directory, index):
+    def generate_tar_file(self, directory, index, tar_path):
         """
         Generates a tar file for the specified directory and manages its state in the backup process.
 
-        This method is designed to be run in a separate thread for each directory. It uses a semaphore to limit
+        This method is designed to be run as a task of the thread pool in backup_directories_tar, whose size limits
         the number of concurrent tar file generation operations, ensuring that the system resources are not
         overwhelmed.
 
@@ -120,83 +148,93 @@ class TapeBackup:
             directory (str): The directory path to be archived into a tar file.
             index     (int): The index of the directory in the original list of directories. This is used to maintain
                             the order of tar files consistent with the order of input directories.
+            tar_path  (str): The path of the tar file to be generated, as computed by backup_directories_tar.
 
         Process:
-            1. Acquires a semaphore token to limit concurrent tar operations.
-            2. Checks if the backup process is still running; exits if not.
-            3. Determines if the directory needs a backup based on the incremental flag and existing backup history.
-            4. If backup is needed, generates a tar file path and adds it to the tars_generating set.
-            5. Executes the tar command to create the tar file and adds the tar path to tars_generated.
-            6. If backup is not needed, removes the corresponding entry from tars_to_be_generated.
-            7. Calls check_and_move_to_write to potentially queue the tar file for writing to tape.
-            8. Checks if all tar files have been generated and sets all_tars_generated flag accordingly.
+            1. Checks if the backup process is still running; exits if not.
+            2. Determines if the directory needs a backup based on the incremental flag and existing backup history.
+            3. If backup is needed, takes a disk token (see take_disk_token), waiting until fewer than
+               max_concurrent_tars tar files are staged, and takes the list of files to be archived from the
+               backup entry.
+            4. With the tar strategy, streams the directory straight to tape if the tape is idle and this
+               directory is the next one to be written (see stream_if_tape_idle).
+            5. Otherwise executes the tar command to create the tar file.
+            6. Calls check_and_move_to_write with the tar path, or with None if no backup was needed or the
+               directory was streamed, to queue the tar file for writing to tape once all preceding directories
+               are done.
+
+        A directory that is skipped only takes its turn for the disk tokens, and a streamed one returns its token
+        right away, as neither leaves a tar file behind.
         """     
-        with self.semaphore:
-            if not self.running:
-                return
+        if not self.running:
+            return
 
-            dir_name = os.path.basename(directory)
-            tar_path = os.path.join(self.tar_dir, f"{dir_name}.tar")
+        needs_backup, backup_entry = self.metadata.prepare_backup_entry(directory, self.incremental)
 
-            needs_backup, backup_entry = self.metadata.prepare_backup_entry(directory, self.incremental)
+        if not self.take_disk_token(index, needs_backup):
+            return
 
-            if needs_backup:
-                # Write files to be backed up to a list file for tar
-                backup_files_list_path = self.write_files_to_temp_list(backup_entry['files'])
+        if needs_backup:
+            files_to_backup = backup_entry['files']
 
-                # Generate tar file
-                tar_command = ["tar", "-cvf", tar_path, "-T", backup_files_list_path]
-                tar_command.extend(["-b", str(self.block_size)])
-                print(f"Generating tar file for {directory}... {tar_command}")
-                subprocess.run(tar_command)
-                os.remove(backup_files_list_path)
-    
-                # After generating tar file, add the mapping
-                self.tar_to_directory_mapping[tar_path] = directory
-
-                with self.generated_lock:
-                    self.tars_generated.append((index, tar_path))
+            if self.strategy == self.STRATEGY_TAR and self.stream_if_tape_idle(directory, index, files_to_backup):
+                self.release_disk_token()
+                tar_path = None
             else:
-                typer.echo(f"No changes in {directory}, skipping backup.")
-                with self.generated_lock, self.to_write_lock:
-                    self.tars_to_be_generated = [item for item in self.tars_to_be_generated if item[1] != tar_path]                
-
-            with self.generating_lock:
-                self.tars_generating.discard(tar_path)
+                # Generate tar file, reading the list of files from standard input
+                tar_command = ["tar", "--totals", "-cf", tar_path, "-T", "-"]
+                tar_command.extend(["-b", str(self.block_size)])
+                typer.echo(f"Generating tar file for {directory}...")
+                logger.debug("Running %s", tar_command)
+                tar_process = self.start_process(tar_command, stdin=subprocess.PIPE)
+                self.feed_file_list(tar_process, files_to_backup)
+                self.wait_process(tar_process)
 
-            self.check_and_move_to_write()
+        else:
+            typer.echo(f"No changes in {directory}, skipping backup.")
+            tar_path = None
 
-            if len(self.tars_to_be_generated) == 0:
-                self.all_tars_generated = True
+        self.check_and_move_to_write(index, tar_path)
 
 
     def write_tar_files_to_tape(self):
         """
-        Writes tar files to the tape drive in the order they were added to the tars_to_write list.
+        Writes tar files to the tape drive in the order they were added to the tars_to_write queue.
 
-        This method continuously checks for tar files that are ready to be written and writes them 
-        to the tape drive, ensuring that the order of files is maintained as per their generation.
+        This method takes tar files that are ready to be written from the queue and writes them to the tape drive,
+        ensuring that the order of files is maintained as per their generation.
 
         Process:
-            1. Runs a loop as long as there are tar files to write or the backup process is still generating tar files.
-            2. Within the loop, acquires a lock to ensure exclusive access to the tars_to_write list.
-            3. Checks if there are any tar files ready to be written. If not, it skips to the next iteration.
-            4. Pops the first tar file from the tars_to_write list for writing.
-            5. Retrieves the associated directory for the tar file and updates the tape position in the metadata.
-            6. Depending on the backup strategy, writes the tar file to the tape using either mbuffer (tar strategy) 
-            or dd command (dd strategy).
-            7. Continues to the next iteration after the tar file is written to tape.
+            1. Takes the next tar file from the tars_to_write queue, waiting until one is available.
+            2. Leaves the loop on the None sentinel that marks the end of the generation, or if the backup
+               process is stopped.
+            3. Retrieves the associated directory for the tar file and updates the tape position in the metadata.
+            4. Writes the tar file to the tape with write_to_tape, which was chosen for the backup strategy on
+               initialization: mbuffer (tar strategy) or dd command (dd strategy).
+            5. If writing fails with an exception, e.g. because mbuffer is not installed, reports the error,
+               stops the backup process and hands the tar file to the unlink thread.
 
         This method ensures that the tar files are written to the tape in an orderly manner, following the sequence 
         in which they were generated. It also updates the tape position in the metadata, ensuring accurate tracking 
         of where each backup is located on the tape.
+
+        Note:
+        The queue is bounded by max_concurrent_tars, so taking a tar file off the queue is what lets a blocked
+        generator thread continue. The wait uses a timeout so that a stop requested by exit_handler is noticed
+        promptly. Once this thread has left its loop, nobody takes entries off the queue any more; this is why
+        an error stops the backup process, which makes the generator threads and the None end marker give up
+        on a full queue instead of waiting for the writer forever.
         """     
-        while self.tars_to_write or (self.running and not self.all_tars_generated):
-            with self.to_write_lock:
-                if not self.tars_to_write:
-                    continue
-                tar_to_write = self.tars_to_write.pop(0)
+        while self.running:
+            try:
+                tar_to_write = self.tars_to_write.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            if tar_to_write is None:
+                break
 
+            try:
                 directory = self.tar_to_directory_mapping.get(tar_to_write)
 
                 if directory:
@@ -204,12 +242,29 @@ class TapeBackup:
                     current_tape_pos = self.tape_operations.show_tape_position()
                     self.metadata.update_tape_position_and_save(directory, current_tape_pos)
 
-                    if self.strategy == self.STRATEGY_TAR:
-                        self.write_to_tape_tar(tar_to_write)
-                    elif self.strategy == self.STRATEGY_DD:
-                        self.write_to_tape_dd(tar_to_write)
+                    self.write_to_tape(tar_to_write)
                 else:
                     typer.echo(f"Error: No directory mapping found for {tar_to_write}")
+            except Exception as e:
+                typer.echo(f"Error occurred while writing {tar_to_write} to tape: {e}")
+                self.running = False
+                self.unlink_queue.put(tar_to_write)  # No longer in any collection cleanup_temp_files looks at
+            finally:
+                # Marks the tape as idle again for stream_if_tape_idle
+                self.tars_to_write.task_done()
+
+
+    def build_mbuffer_command(self, *options):
+        """
+        Builds the mbuffer command line that writes its standard input to the tape drive.
+
+        Parameters:
+        - options (str): Additional mbuffer options, inserted before the buffer settings.
+
+        Returns:
+        - list: The command as a list of arguments, suitable for subprocess without a shell.
+        """
+        return ["mbuffer", "-P", str(self.memory_buffer_percent), *options, "-m", self.memory_buffer, "-s", str(self.block_size), "-v", "1", "-o", self.device_path]
 
 
     def write_to_tape_tar(self, tar_path):
@@ -220,36 +275,105 @@ class TapeBackup:
         - tar_path: The path to the tar file to be written to tape.
 
         Process:
-        1. Opens a log file (dd_log_path) for appending output messages.
-        2. Writes a log entry indicating the start of writing the specified tar file.
-        3. Constructs a shell command that uses `cat` to read the tar file and pipes it through `mbuffer` to the tape drive.
+        1. Writes an entry to the log file (dd_log) indicating the start of writing the specified tar file.
+        2. Constructs an `mbuffer` command that writes to the tape drive, and opens the tar file as its standard input,
+           advising the kernel that the file will be read sequentially.
              - `mbuffer` is used to manage the buffer and ensure efficient writing to the tape drive.
              - The command also redirects `mbuffer`'s verbose output to the log file for monitoring and debugging.
-        4. Executes the command using `subprocess.Popen` to allow asynchronous processing and capturing of stderr for logging.
-        5. Logs any errors or messages produced by the `mbuffer` process to the log file.
-        6. Waits for the command to complete and checks for any non-zero return code, indicating an error.
-        7. After writing, sends an 'end-of-file' marker to the tape drive using the `mt` command.
-        8. Removes the tar file from the filesystem to free up space.
+        3. Executes the command using `subprocess.Popen` without a shell, capturing stderr for logging.
+        4. Logs any errors or messages produced by the `mbuffer` process to the log file.
+        5. Waits for the command to complete and checks for any non-zero return code, indicating an error.
+        6. After writing, sends an 'end-of-file' marker to the tape drive using the `mt` command.
+        7. Hands the tar file to the unlink thread, which removes it from the filesystem to free up space.
 
         This method ensures that each tar file is written securely and efficiently to the tape drive while providing detailed logs of the operation.
         """        
-        dd_log_path = os.path.join(self.tar_dir, "dd_output.log")
-        with open(dd_log_path, 'a') as dd_log:
-            dd_log.write(f"\nWriting {tar_path} to tape...\n")
-            dd_log.flush()
+        self.dd_log.write(f"\nWriting {tar_path} to tape...\n")
 
-            # Use cat to read the tar file and pipe it through mbuffer to the tape drive
-            backup_command = f"cat {tar_path} | mbuffer -P {self.memory_buffer_percent} -m {self.memory_buffer} -s {self.block_size} -v 1 -o {self.device_path} -l {dd_log_path} -v 3"
-            process = subprocess.Popen(backup_command, shell=True, stdout=subprocess.PIPE, stderr=dd_log, text=True)
+        # mbuffer reads the tar file directly as its standard input and writes it to the tape drive
+        mbuffer_command = self.build_mbuffer_command() + ["-l", self.dd_log_path, "-v", "3"]
+        with open(tar_path, 'rb') as tar_file:
+            if hasattr(os, "posix_fadvise"):
+                # mbuffer shares this open file, so it reads with the larger readahead of a sequential file
+                os.posix_fadvise(tar_file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            process = self.start_process(mbuffer_command, stdin=tar_file, stdout=subprocess.DEVNULL, stderr=self.dd_log)
 
-            process.wait()
-            if process.returncode != 0:
-                typer.echo(f"Error occurred during backup of {tar_path}. Error code: {process.returncode}")
+        self.wait_process(process)
+        if process.returncode != 0:
+            typer.echo(f"Error occurred during backup of {tar_path}. Error code: {process.returncode}")
 
         # Write an end of file marker. It appears the device does it automatically, but just in case
         # we want to remember, here is how it would be done manually.
         # subprocess.run(['mt', '-f', self.device_path, 'weof', '1'])
-        os.remove(tar_path)
+        self.unlink_queue.put(tar_path)
+
+
+    def stream_if_tape_idle(self, directory, index, files_to_backup):
+        """
+        Streams a directory straight to tape instead of staging it as a tar file, if the tape is idle.
+
+        Staging a tar file writes every byte to the tar directory and reads it back again for the tape. That
+        only pays off if the tape is busy with an earlier directory in the meantime. If the tape is idle and
+        waiting for exactly this directory, the archive is piped from tar to mbuffer instead.
+
+        Parameters:
+        - directory (str): The directory to be backed up.
+        - index (int): The index of the directory in the original list of directories.
+        - files_to_backup (iterable): The file paths to be backed up.
+
+        Returns:
+        - bool: True if the directory was streamed to tape, False if it needs to be staged as a tar file.
+
+        Note:
+        - The tape is idle for this directory if all preceding directories have been taken off the 'generated'
+          heap (next_tar_index is this index) and the writer thread has finished every tar file it was given
+          (the queue has no unfinished tasks). The generated_lock is held while streaming, so no later tar
+          file can be queued in between; the generator threads of later directories wait for it when they
+          finish, exactly as they would wait for this directory's tar file otherwise.
+        """
+        with self.generated_lock:
+            if index != self.next_tar_index or self.tars_to_write.unfinished_tasks:
+                return False
+
+            # Update tape position before writing
+            current_tape_pos = self.tape_operations.show_tape_position()
+            self.metadata.update_tape_position_and_save(directory, current_tape_pos)
+
+            self.stream_to_tape_tar(directory, files_to_backup)
+        return True
+
+
+    def stream_to_tape_tar(self, directory, files_to_backup):
+        """
+        Pipes a tar archive of the listed files through mbuffer to the tape drive and logs the process.
+
+        Parameters:
+        - directory (str): The directory being backed up, used for log messages.
+        - files_to_backup (iterable): The file paths to be backed up.
+
+        Process:
+        1. Writes an entry to the log file (dd_log) indicating the start of streaming the directory.
+        2. Starts tar writing the archive to its standard output, and mbuffer reading it from there and writing
+           it to the tape drive with the same options as write_to_tape_tar.
+        3. Feeds the list of files to tar's standard input.
+        4. Waits for both processes and reports a non-zero return code of either of them.
+        """
+        self.dd_log.write(f"\nStreaming {directory} to tape...\n")
+
+        tar_command     = ["tar", "--totals", "-cf", "-", "-T", "-", "-b", str(self.block_size)]
+        mbuffer_command = self.build_mbuffer_command() + ["-l", self.dd_log_path, "-v", "3"]
+        typer.echo(f"Streaming {directory} to {self.device_path}...")
+        logger.debug("Running %s | %s", tar_command, mbuffer_command)
+
+        tar_process     = self.start_process(tar_command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        mbuffer_process = self.start_process(mbuffer_command, stdin=tar_process.stdout, stdout=subprocess.DEVNULL, stderr=self.dd_log)
+        tar_process.stdout.close()  # mbuffer holds the only reader, so tar sees a broken pipe if mbuffer dies
+        self.feed_file_list(tar_process, files_to_backup)
+
+        self.wait_process(mbuffer_process)
+        self.wait_process(tar_process)
+        if tar_process.returncode != 0 or mbuffer_process.returncode != 0:
+            typer.echo(f"Error occurred during backup of {directory}. Error codes: tar {tar_process.returncode}, mbuffer {mbuffer_process.returncode}")
 
 
     def write_to_tape_dd(self, tar_path):
@@ -260,80 +384,192 @@ class TapeBackup:
         - tar_path: The path to the tar file to be written to tape.
 
         Process:
-        1. Opens or creates a log file (dd_log_path) for appending process messages.
-        2. Writes an entry in the log file indicating the initiation of writing the specified tar file to tape.
-        3. Constructs and executes a dd command to perform the writing operation.
+        1. Writes an entry in the log file (dd_log) indicating the initiation of writing the specified tar file to tape.
+        2. Constructs and executes a dd command to perform the writing operation.
             - The 'if' parameter specifies the input file (tar file) to read from.
             - The 'of' parameter designates the output file (tape drive) to write to.
-            - The 'bs' parameter sets the block size for data transfer.
+            - The 'ibs' parameter sets the size of the reads from the tar file (read_block_size), and 'iflag=fullblock'
+              makes dd fill each of them completely. 'iflag=nocache' lets dd drop the pages it has read from the page
+              cache, as the tar file is not read again.
+            - The 'obs' parameter sets the block size for the writes to the tape drive.
             - The 'status=progress' option enables real-time progress output.
-        4. Captures and logs the standard error output of the dd command for monitoring and troubleshooting.
-        5. Upon completion, sends an 'end-of-file' marker to the tape drive using the 'mt' command.
-        6. Removes the tar file from the filesystem to conserve space.
+        3. Captures and logs the standard error output of the dd command for monitoring and troubleshooting.
+        4. Upon completion, sends an 'end-of-file' marker to the tape drive using the 'mt' command.
+        5. Hands the tar file to the unlink thread, which removes it from the filesystem to conserve space.
 
         This method offers a straightforward approach to writing tar files to tape using dd. It is suitable for
         situations where mbuffer is not required or preferred, providing a direct and efficient data transfer mechanism.
-        """        
-        dd_log_path = os.path.join(self.tar_dir, "dd_output.log")
-        with open(dd_log_path, 'a') as dd_log:
-            dd_log.write(f"\nWriting {tar_path} to tape...\n")
-            dd_log.flush()
-            dd_command = ["dd", "if={}".format(tar_path), "of={}".format(self.device_path), "bs={}".format(self.block_size), "status=progress"]
-            subprocess.run(dd_command, stderr=dd_log)
+
+        Note:
+        The copy is deliberately left to dd rather than os.sendfile. Every write to a tape device becomes one
+        tape block, and dd issues exactly one write of 'obs' bytes per block. sendfile splices through a pipe
+        in page-sized pieces, which would write blocks of the wrong size, and the st driver does not accept
+        spliced writes on most kernels anyway.
+        """
+        self.dd_log.write(f"\nWriting {tar_path} to tape...\n")
+        dd_command = ["dd", "if={}".format(tar_path), "of={}".format(self.device_path), "ibs={}".format(self.read_block_size), "obs={}".format(self.block_size), "iflag=fullblock,nocache", "status=progress"]
+        self.wait_process(self.start_process(dd_command, stderr=self.dd_log))
 
         # Write an end of file marker. It appears the device does it automatically, but just in case
         # we want to remember, here is how it would be done manually.
         # subprocess.run(['mt', '-f', self.device_path, 'weof', '1'])
-        os.remove(tar_path)
+        self.unlink_queue.put(tar_path)
 
 
-    def continuously_check_and_move(self):
+    def take_disk_token(self, index, needed = True):
         """
-        Continuously checks and moves tar files from the generated list to the writing queue.
+        Takes a disk token for the tar file of a directory, waiting for the turn of the directory and a free token.
 
-        Process:
-        1. The method enters a loop that runs until all tar files are generated and the list of generated tar files is empty.
-        2. Within the loop, it calls the check_and_move_to_write() method.
-            - This method is responsible for moving tar files that are ready to be written from the generated list to the writing queue.
-        3. The loop includes a sleep interval of 1 second to prevent high CPU usage, allowing other processes to execute.
-
-        This method ensures that as soon as a tar file is ready (i.e., fully generated), it is promptly moved
-        to the writing queue. The continuous checking mechanism is crucial for maintaining the flow of the backup process,
-        ensuring that tar files are written to tape as soon as they become available. It plays a key role in optimizing
-        the tape writing process, especially when dealing with large or numerous files.
-        """        
-        while not self.all_tars_generated or self.tars_generated:
-            self.check_and_move_to_write()
-            time.sleep(1)
+        Parameters:
+        - index (int): The index of the directory in the original list of directories.
+        - needed (bool): False if the directory needs no tar file, e.g. because it is unchanged; it then only
+          takes its turn.
+
+        Returns:
+        - bool: True once the token is taken, False if the backup process was stopped while waiting.
+
+        Note:
+        The tokens are taken in the order of the directories. A plain semaphore could hand all tokens to tar
+        files that finished early and wait on the heap for a predecessor, while the predecessor itself waits
+        for a token, which would never come. Taken in order, every token is held by a tar file that comes
+        before the waiting directory, and these can all be written to tape and removed without it. The wait
+        is done in short slices so that a stop requested by exit_handler is noticed promptly.
+        """
+        with self.disk_token_condition:
+            while self.disk_token_turn != index or (needed and self.disk_tokens == 0):
+                if not self.running:
+                    return False
+                self.disk_token_condition.wait(timeout=0.5)
+
+            self.disk_token_turn += 1
+            if needed:
+                self.disk_tokens -= 1
+            self.disk_token_condition.notify_all()
+        return True
+
+
+    def release_disk_token(self):
+        """
+        Returns a disk token once a tar file has been removed, or was never created, and wakes up the waiting
+        generator threads.
+        """
+        with self.disk_token_condition:
+            self.disk_tokens += 1
+            self.disk_token_condition.notify_all()
 
 
-    def check_and_move_to_write(self):
+    def check_and_move_to_write(self, index, tar_path):
         """
-        Checks and moves tar files from the 'generated' list to the 'to write' queue based on their generation order.
+        Records a finished tar file and moves all tar files that are next in order to the 'to write' queue.
+
+        Parameters:
+        - index (int): The index of the directory the tar file was generated for.
+        - tar_path (str): The path of the generated tar file, or None if the directory was skipped.
 
         Process:
-        1. The method acquires locks for both the 'generated' and 'to write' lists to ensure thread-safe access.
-        2. It checks if there are any tar files left to be generated. If not, the method returns without doing anything.
-        3. It retrieves the index and path of the next expected tar file from the 'tars_to_be_generated' list.
-        4. The method then iterates over the 'tars_generated' list to find a match for the expected tar file.
-        5. Once the matching tar file is found:
-            - It is appended to the 'tars_to_write' list, making it ready for writing to tape.
-            - The method then removes this tar file from both the 'tars_generated' list and the 'tars_to_be_generated' list.
-            - The loop breaks after moving the tar file, ensuring that only the next expected file in order is processed.
+        1. The method acquires the lock for the 'generated' heap to ensure thread-safe access.
+        2. It pushes (index, tar_path) onto the 'tars_generated' min-heap.
+        3. As long as the smallest index on the heap is the next expected one ('next_tar_index'), the entry is
+           popped, 'next_tar_index' is advanced, and the tar file (if the directory was not skipped) is put
+           on the 'tars_to_write' queue.
 
         This method ensures that tar files are written to tape in the same order as they were originally planned to
         be generated. It handles the crucial task of synchronizing the generation and writing processes, maintaining
-        the integrity and order of the backup data.
+        the integrity and order of the backup data. It is called by every generator thread when it finishes, which
+        makes a separate polling thread unnecessary, and both heap operations are O(log n) in the number of tar files
+        waiting for a predecessor.
+
+        Note:
+        The lock is held while putting to the queue, so that tar files are queued in order. When the tape falls behind
+        and the queue is full, this blocks the generator threads. Tar files that finish out of order go onto the heap
+        without blocking, though; the number of tar files staged in the tar directories is bounded by the disk tokens
+        (see take_disk_token).
         """        
-        with self.generated_lock, self.to_write_lock:
-            if self.tars_to_be_generated:
-                expected_index, expected_tar = self.tars_to_be_generated[0]
-                for generated_index, generated_tar in self.tars_generated:
-                    if generated_index == expected_index:
-                        self.tars_to_write.append(generated_tar)
-                        self.tars_generated.remove((generated_index, generated_tar))
-                        self.tars_to_be_generated.pop(0)
-                        break
+        with self.generated_lock:
+            heapq.heappush(self.tars_generated, (index, tar_path))
+
+            while self.tars_generated and self.tars_generated[0][0] == self.next_tar_index:
+                _, generated_tar = self.tars_generated[0]
+                if generated_tar is not None and not self.queue_tar_for_writing(generated_tar):
+                    return
+                heapq.heappop(self.tars_generated)
+                self.next_tar_index += 1
+
+
+    def queue_tar_for_writing(self, tar_path):
+        """
+        Puts a tar file, or the None end marker, on the 'to write' queue, waiting while the queue is full.
+
+        Parameters:
+        - tar_path (str): The path of the tar file to be written, or None to signal the end of the generation.
+
+        Returns:
+        - bool: True if the entry was queued, False if the backup process was stopped while waiting.
+
+        Note:
+        The wait is done in short slices so that a stopped writer thread cannot leave the caller blocked forever.
+        """
+        while self.running:
+            try:
+                self.tars_to_write.put(tar_path, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+    def start_process(self, command, **kwargs):
+        """
+        Starts a tar, mbuffer or dd process and registers it, so that exit_handler can stop it.
+
+        Parameters:
+        - command (list): The command as a list of arguments.
+        - kwargs: Further arguments for subprocess.Popen, such as stdin, stdout and stderr.
+
+        Returns:
+        - subprocess.Popen: The started process. It has to be waited for with wait_process.
+
+        Note:
+        If the backup process was stopped while the process was being started, exit_handler may have missed it,
+        so it is terminated right away.
+        """
+        process = subprocess.Popen(command, **kwargs)
+        self.children.add(process)
+        if not self.running:
+            process.terminate()
+        return process
+
+
+    def wait_process(self, process):
+        """
+        Waits for a process started with start_process and unregisters it.
+
+        Parameters:
+        - process (subprocess.Popen): The process to wait for.
+
+        Returns:
+        - int: The return code of the process.
+        """
+        process.wait()
+        self.children.discard(process)
+        return process.returncode
+
+
+    def unlink_tar_files(self):
+        """
+        Removes the tar files handed over through unlink_queue until the None end marker arrives.
+
+        Removing a tar file of many gigabytes can take a noticeable time while the file system frees its
+        extents. This method runs in its own thread, so the writer thread can start the next tar file
+        right away and the tape keeps streaming. The disk token of each tar file is returned once it
+        has been removed.
+        """
+        while (tar_path := self.unlink_queue.get()) is not None:
+            try:
+                os.remove(tar_path)
+            except FileNotFoundError:
+                pass  # Already written and removed, or never created
+            self.release_disk_token()
 
 
     def backup_directories(self, directories):
@@ -367,9 +603,7 @@ class TapeBackup:
         """
         if self.strategy == self.STRATEGY_DIRECT:
             self.backup_directories_direct(directories)
-        elif self.strategy == self.STRATEGY_TAR:
-            self.backup_directories_tar(directories)
-        elif self.strategy == self.STRATEGY_DD:
+        elif self.strategy in (self.STRATEGY_TAR, self.STRATEGY_DD):
             self.backup_directories_tar(directories)
         else:
             raise ValueError("Invalid backup strategy")
@@ -380,15 +614,16 @@ class TapeBackup:
         Initiates the backup process for the given list of directories.
 
         Process:
-        1. Generates a list of tar file paths ('tars_to_be_generated') based on the provided directories.
-        2. Creates and starts separate threads ('tar_threads') for generating tar files for each directory.
-        3. Starts a 'check_thread' to continuously monitor and move generated tar files to the 'to write' list.
-        4. Initiates the 'dd_thread' for writing tar files to tape from the 'to write' list.
-        5. Waits for all tar generation threads to complete.
-        6. Once all tars are generated, sets 'all_tars_generated' to True.
-        7. Waits for the 'check_thread' to finish processing all generated tar files.
-        8. Waits for the 'dd_thread' to complete writing all tar files to tape.
-        9. Finally, calls 'cleanup_temp_files' to remove any temporary files.
+        1. Computes the tar file path for each directory once ('tar_paths'), taking the tar directories in turn, and
+           maps each tar file path to its directory ('tar_to_directory_mapping').
+        2. Submits the generation of a tar file for each directory to a thread pool of 'max_concurrent_tars' threads.
+           Each task puts its tar file on the 'to write' queue once all preceding tar files are done.
+        3. Initiates the 'dd_thread' for writing tar files to tape from the 'to write' queue.
+        4. Waits for all tar generation tasks to complete. If one of them fails, the error is reported and the
+           backup is stopped, as the tar files after it could never be written in order.
+        5. Once all tars are generated, puts the None end marker on the queue for the 'dd_thread'.
+        6. Waits for the 'dd_thread' to complete writing all tar files to tape.
+        7. Finally, calls 'cleanup_temp_files' to remove any temporary files.
 
         This method orchestrates the entire backup process, ensuring that tar files are generated, queued,
         and written to tape in a controlled and orderly manner. It leverages multithreading to efficiently
@@ -401,52 +636,67 @@ class TapeBackup:
         The method assumes that each directory in the 'directories' list is a valid path and tha
         the tape device and block size have been correctly configured.
         """
-        self.tars_to_be_generated = [(index, os.path.join(self.tar_dir, f"{os.path.basename(dir)}.tar")) for index, dir in enumerate(directories)]
+        # Line buffered, so each entry is on disk before a process writing to the same file starts
+        self.dd_log = open(self.dd_log_path, 'a', buffering=1)
 
-        tar_threads = [threading.Thread(target=self.generate_tar_file, args=(directory, index)) for index, directory in enumerate(directories)]
-        for thread in tar_threads:
-            thread.start()
-
-        check_thread = threading.Thread(target=self.continuously_check_and_move)
-        check_thread.start()
+        self.unlink_thread = threading.Thread(target=self.unlink_tar_files, daemon=True)
+        self.unlink_thread.start()
 
         dd_thread = threading.Thread(target=self.write_tar_files_to_tape)
         dd_thread.start()
 
-        for thread in tar_threads:
-            thread.join()
+        tar_paths = [os.path.join(self.tar_dirs[index % len(self.tar_dirs)], f"{os.path.basename(directory)}.tar") for index, directory in enumerate(directories)]
+
+        # Filled before any worker starts, so the threads only ever read it
+        self.tar_to_directory_mapping = dict(zip(tar_paths, directories))
+
+        # The pool is the only limit on concurrent tar generation; its threads are created on demand
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_tars) as executor:
+            self.tar_futures = {executor.submit(self.generate_tar_file, directory, index, tar_path): tar_path for index, (directory, tar_path) in enumerate(zip(directories, tar_paths))}
+            for future in as_completed(self.tar_futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    typer.echo(f"Error occurred during tar file generation: {e}")
+                    self.running = False
+
+        self.queue_tar_for_writing(None)
 
-        self.all_tars_generated = True
-        check_thread.join()
         dd_thread.join()
 
         self.cleanup_temp_files()
 
 
-    def write_files_to_temp_list(self, files_to_backup):
+    def feed_file_list(self, tar_process, files_to_backup):
         """
-        Creates a temporary file listing all the files to be backed up.
+        Writes the list of files to be backed up to the standard input of a tar process reading it with "-T -".
 
-        This method takes a list of file paths that are to be included in the backup and writes them 
-        into a temporary file. This file is then used by the tar command to know which files to include 
-        in the tar archive.
+        Passing the list through a pipe avoids creating, writing and removing a list file in the tar
+        directory for every backup.
 
         Parameters:
-        - files_to_backup (list): A list of file paths to be included in the backup.
-
-        Returns:
-        - str: The path to the temporary file containing the list of files to backup.
+        - tar_process (subprocess.Popen): The tar process, started with stdin=subprocess.PIPE.
+        - files_to_backup (iterable): The file paths to be included in the backup.
 
         Note:
-        - The temporary file is created in the directory specified for storing tar files.
-        - Each file path is written to a new line in the temporary file.
-        - The temporary file is not automatically deleted and should be removed after it's no longer needed.
+        - Each file path is written to a new line, and tar's standard input is closed afterwards.
+        - The paths are joined and encoded in slices of LIST_WRITE_BATCH, so a slice costs one write
+          call while the memory needed for a huge list stays bounded.
+        - Paths are encoded like os.fsencode does, so names that are not valid in the file system
+          encoding are written back as the original bytes.
+        - Any process reading tar's output must already be running, as tar may block on its output
+          before it has read the whole list.
+        - If tar exits early, or the backup process is stopped, the rest of the list is dropped; the caller sees
+          the failure in tar's return code.
         """
-        with tempfile.NamedTemporaryFile(mode='w+', dir=self.tar_dir, delete=False) as temp_file:
-            backup_files_list_path = temp_file.name
-            for file in files_to_backup:
-                temp_file.write(f"{file}\n")
-        return backup_files_list_path
+        paths = iter(files_to_backup)
+        try:
+            with tar_process.stdin as list_file:
+                while self.running and (batch := list(islice(paths, LIST_WRITE_BATCH))):
+                    batch.append("")  # Terminates the last path with a newline
+                    list_file.write("\n".join(batch).encode(FS_ENCODING, "surrogateescape"))
+        except BrokenPipeError:
+            pass
 
 
     def backup_directories_direct(self, directories: list):
@@ -461,12 +711,13 @@ class TapeBackup:
 
         Process:
         1. Iterate through each directory in the provided list.
-        2. Determine if the directory needs backup (in case of incremental backups).
-        3. If a backup is needed, create a list of files to be backed up and write this list to a temporary file.
-        4. Construct a tar command to create an archive and pipe it directly to mbuffer, which writes to the tape drive.
-        5. Execute the backup command and handle any exceptions or errors.
-        6. Remove the temporary file after use.
-        7. Echo the status of each backup operation.
+        2. Determine if the directory needs backup (in case of incremental backups). The backup entry of the next
+           directory is already prepared in the background while the current one is written to tape.
+        3. If a backup is needed, take the list of files to be backed up from the backup entry.
+        4. Construct a tar command to create an archive and an mbuffer command which writes to the tape drive.
+        5. Run both without a shell, with tar's output piped directly into mbuffer and the list of files fed to tar's
+           standard input, and handle any exceptions or errors.
+        6. Echo the status of each backup operation.
 
         Returns:
         - str: A message indicating the completion of all backup operations.
@@ -475,43 +726,69 @@ class TapeBackup:
         - This method is designed for scenarios where immediate writing of data to tape is preferred.
         - It assumes the tape device and block size have been correctly configured.
         - The method handles both incremental and full backups based on the provided settings.
+        - Each directory remains a tape file of its own, with its own mbuffer run, as the tape positions recorded
+          in the metadata and used for restores refer to these files. Preparing the next backup entry while the
+          tape is busy keeps the gap between two tape files short instead: without it, the drive would stand
+          still while the next directory is scanned.
         """        
-        for directory in directories:
-            typer.echo(f"Backing up directory {directory} to {self.device_path}...")
-            needs_backup, backup_entry = self.metadata.prepare_backup_entry(directory, self.incremental)
-
-            if not needs_backup:
-                typer.echo(f"No changes in {directory}, skipping backup.")
-                continue
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            next_entry = None
+            for position, directory in enumerate(directories):
+                if not self.running:
+                    return "Backup interrupted."
+
+                typer.echo(f"Backing up directory {directory} to {self.device_path}...")
+                if next_entry is None:
+                    next_entry = prefetcher.submit(self.metadata.prepare_backup_entry, directory, self.incremental)
+                needs_backup, backup_entry = next_entry.result()
+
+                next_entry = None
+                if position + 1 < len(directories):
+                    next_entry = prefetcher.submit(self.metadata.prepare_backup_entry, directories[position + 1], self.incremental)
+
+                if needs_backup:
+                    self.backup_directory_direct(directory, backup_entry)
+                else:
+                    typer.echo(f"No changes in {directory}, skipping backup.")
 
-            backup_files_list_path = self.write_files_to_temp_list(backup_entry['files'])
+        return "All backups completed."
 
-            tar_options = ["tar", "-cvf", "-", "-T", backup_files_list_path]
-            tar_options.extend(["-b", str(self.block_size)])
-            backup_command = " ".join(tar_options) + f" | mbuffer -P {self.memory_buffer_percent} -A \"pytp load 18\" -m {self.memory_buffer} -s {self.block_size} -v 1 -o {self.device_path}"
 
-            current_tape_pos = self.tape_operations.show_tape_position()
-            self.metadata.update_tape_position_and_save(directory, current_tape_pos)
+    def backup_directory_direct(self, directory, backup_entry):
+        """
+        Streams a single directory to the tape drive, piping tar through mbuffer.
 
-            print(f"Backing up {directory} to {self.device_path}... {backup_command}")
+        Parameters:
+        - directory (str): The directory to be backed up.
+        - backup_entry (dict): The backup entry prepared for the directory, holding the files to be backed up.
 
-            # Execute the backup command
-            process = subprocess.Popen(backup_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            try:
-                for line in process.stderr:
-                    print(line, end='')  # Printing stderr for monitoring
-                process.wait()
-                if process.returncode != 0:
-                    typer.echo(f"Error occurred during backup of {directory}. Error code: {process.returncode}")
-                    continue
-            except Exception as e:
-                typer.echo(f"Error occurred during backup of {directory}: {e}")
-            finally:
-                process.stderr.close()
-                os.remove(backup_files_list_path)  # Remove the temporary file after use
+        Note:
+        - The tape position is recorded in the metadata before the directory is written.
+        """
+        tar_command = ["tar", "--totals", "-cf", "-", "-T", "-"]
+        tar_command.extend(["-b", str(self.block_size)])
+        mbuffer_command = self.build_mbuffer_command("-A", "pytp load 18")
+
+        current_tape_pos = self.tape_operations.show_tape_position()
+        self.metadata.update_tape_position_and_save(directory, current_tape_pos)
+
+        logger.debug("Running %s | %s", tar_command, mbuffer_command)
+
+        # Execute the backup pipeline; tar and mbuffer report to our stderr directly
+        try:
+            tar_process     = self.start_process(tar_command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            mbuffer_process = self.start_process(mbuffer_command, stdin=tar_process.stdout, stdout=subprocess.DEVNULL)
+            tar_process.stdout.close()  # mbuffer holds the only reader, so tar sees a broken pipe if mbuffer dies
+            self.feed_file_list(tar_process, backup_entry['files'])
+
+            self.wait_process(mbuffer_process)
+            self.wait_process(tar_process)
+            if tar_process.returncode != 0 or mbuffer_process.returncode != 0:
+                typer.echo(f"Error occurred during backup of {directory}. Error codes: tar {tar_process.returncode}, mbuffer {mbuffer_process.returncode}")
+            else:
                 typer.echo(f"Backup of {directory} completed successfully.")
-
-        return "All backups completed."
+        except Exception as e:
+            typer.echo(f"Error occurred during backup of {directory}: {e}")
 
 
     def cleanup_temp_files(self):
@@ -525,10 +802,34 @@ class TapeBackup:
 
         Note:
         This method should be called as a part of the cleanup process after backup operations are completed or interrupted.
+        Each collection is copied under the lock that guards it, and the leftover tar files are handed to the unlink
+        thread behind the ones that were already written to tape. The method waits for the unlink thread to remove
+        all of them, and closes the log file for the tape writes. Without a running unlink thread, the files are
+        removed in the calling thread.
         """        
-        for tar_path in self.tars_generating.union(set(self.tars_generated), set(self.tars_to_write)):
-            if os.path.exists(tar_path):
-                os.remove(tar_path)
+        # A task that is still running or has failed may have left a partial tar file behind; a finished
+        # task has handed its tar file to the 'generated' heap or the 'to write' queue
+        generating_paths = [tar_path for future, tar_path in list(self.tar_futures.items())
+                            if not future.done() or (not future.cancelled() and future.exception() is not None)]
+        with self.generated_lock:
+            generated_paths = [tar_path for _, tar_path in self.tars_generated]
+        with self.tars_to_write.mutex:
+            queued_paths = list(self.tars_to_write.queue)
+
+        for tar_path in chain(generating_paths, generated_paths, queued_paths):
+            if tar_path is not None:
+                self.unlink_queue.put(tar_path)
+        self.unlink_queue.put(None)
+
+        if self.unlink_thread is not None:
+            self.unlink_thread.join()
+            self.unlink_thread = None
+        else:
+            self.unlink_tar_files()
+
+        if self.dd_log is not None:
+            self.dd_log.close()
+            self.dd_log = None
 
 
     def exit_handler(self, signum, frame):
@@ -537,17 +838,22 @@ class TapeBackup:
 
         This method is intended to be used as a signal handler for signals such as SIGINT (Ctrl+C).
         Upon receiving such a signal, it stops the backup process by setting the 'running' flag to
-        False and invokes the cleanup method to remove any temporary files. It then prints a message
-        indicating that the process is exiting gracefully.
+        False, terminates the tar, mbuffer and dd processes that are still running, and prints a
+        message indicating that the process is exiting gracefully.
 
         Parameters:
         signum (int): The signal number.
         frame (frame object): The current stack frame.
 
         Note:
-        This handler ensures that the program exits in a controlled manner, performing necessary
-        cleanup to avoid leaving the system in an inconsistent state.
+        The handler deliberately does no cleanup itself: it may interrupt the main thread while it
+        holds one of the locks shared with the worker threads. The writer and generator threads
+        observe the 'running' flag and wind down, after which backup_directories_tar removes the
+        temporary files via cleanup_temp_files as it does at the end of every tar backup.
+        Terminating the child processes only sends them a signal, which needs no lock; without it,
+        a stop would take effect only after the current tar file of possibly many gigabytes.
         """        
         self.running = False
-        self.cleanup_temp_files()
+        for process in list(self.children):
+            process.terminate()
         typer.echo("Exiting gracefully...")
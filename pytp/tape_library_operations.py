@@ -1,15 +1,19 @@
 import errno
 import subprocess
-import threading
-import typer
-import json
 import os
 import pty
-import select
+import re
+import time
 from pytp.config_manager import ConfigManager
 from rich.console import Console
 from rich.table import Table
 
+# Lines of 'mtx status' for drives, e.g. "Data Transfer Element 1:Full (Storage Element 2 Loaded):VolumeTag = P0003SL9",
+# or "Data Transfer Element 0:Full (Unknown Storage Element Loaded):VolumeTag = P0003SL9" if the source slot is unknown,
+# and for slots, e.g. "Storage Element 1:Full :VolumeTag=P0001SL9" or "Storage Element 24 IMPORT/EXPORT:Empty"
+DRIVE_PATTERN = re.compile(r"\s*Data Transfer Element (?P<number>\d+):(?P<status>\w+)(?: \((?:Storage Element (?P<slot_loaded>\d+)|(?P<unknown_slot>Unknown) Storage Element) Loaded\))?(?:\s*:VolumeTag\s*=\s*(?P<volume_tag>\S*))?")
+SLOT_PATTERN  = re.compile(r"\s*Storage Element (?P<number>\d+)(?P<import_export> IMPORT/EXPORT)?:(?P<status>\w+)(?:\s*:VolumeTag\s*=\s*(?P<volume_tag>\S*))?")
+
 class TapeLibraryOperations:
     """
     TapeLibraryOperations class encapsulates various operations related to tape libraries.
@@ -17,14 +21,20 @@ class TapeLibraryOperations:
     This class provides methods to interact with tape libraries for operations like
     loading, unloading tapes, and managing slots. It serves as a high-level interface
     to tape libraries, abstracting the complexities of low-level tape library management.
+
+    Attributes:
+        status_ttl   (float): Seconds for which the parsed status of the library is reused by list_tapes.
+        status_cache  (dict): The parsed status of the library from the last status command, or None.
+        status_time  (float): Monotonic time at which status_cache was filled.
     """
 
-    def __init__(self, library_name):
+    def __init__(self, library_name, status_ttl = 3):
         """
         Initializes the TapeLibraryOperations class.
 
         Args:
-            library_name (str): The name of the tape library to operate on.
+            library_name   (str): The name of the tape library to operate on.
+            status_ttl   (float): Seconds for which the status of the library is reused, 0 to always query it.
         """
         self.config_manager     = ConfigManager()
         self.library_name       = library_name
@@ -33,36 +43,41 @@ class TapeLibraryOperations:
 
         self.device_path        = self.library_details.get('device_path')
 
+        self.status_ttl         = status_ttl
+        self.status_cache       = None
+        self.status_time        = 0.0
+
 
     def run_mtx_command(self, command, verbose: bool = False):
         full_command = ["mtx", "-f", self.device_path] + command
 
+        if command[0] != "status":
+            # Any other command may move tapes, even if it fails halfway
+            self.invalidate_status()
+
         if verbose:
             master, slave = pty.openpty()
+            process = None
             try:
                 process = subprocess.Popen(full_command, stdout=slave, stderr=slave, text=True)
                 os.close(slave)  # Close the slave part as it is not used
 
+                # Blocking reads wake up exactly when mtx writes; once mtx has exited and the slave side is
+                # closed, the read fails with EIO, after all output has been read
                 output_lines = []
                 while True:
-                    if process.poll() is not None:
-                        # Process has finished, no more output expected
+                    try:
+                        line = os.read(master, 1024).decode()
+                        if not line:
+                            break  # End of output
+                        print(line, end='', flush=True)
+                        output_lines.append(line.strip())
+                    except OSError as e:
+                        if e.errno != errno.EIO:
+                            print(f"Read error: {e}", flush=True)
+                            raise
                         break
 
-                    r, _, _ = select.select([master], [], [], 0.1)
-                    if master in r:
-                        try:
-                            line = os.read(master, 1024).decode()
-                            if not line:
-                                break  # End of output
-                            print(line, end='', flush=True)
-                            output_lines.append(line.strip())
-                        except OSError as e:
-                            if e.errno != errno.EIO:
-                                print(f"Read error: {e}", flush=True)
-                                raise
-                            break
-
                 process.wait()  # Wait for the process to finish
                 # return "\n".join(output_lines) # avoid double output for now, but let's keep this around for a while
                 return ""
@@ -81,16 +96,38 @@ class TapeLibraryOperations:
                 return f"Error: {e.stderr}"
 
 
-    
+    def invalidate_status(self):
+        """
+        Discards the cached status of the tape library, so that the next call to list_tapes queries it again.
+
+        This is done automatically for every mtx command that may move tapes. Callers that change the library
+        by other means, e.g. through a second instance, can call it directly.
+        """
+        self.status_cache = None
+
+
     def list_tapes(self):
         """
         Lists the contents of the tape library, including slots and tapes.
 
         Returns:
-            str: A string containing information about the slots and tapes in the library.
+            dict: The parsed status of the library, see parse_tape_library_output.
+
+        Note:
+        Loading, unloading and moving a tape each look up the status first, and loading may unload another tape
+        before. Running 'mtx status' is slow, as the changer has to report on every slot, so a parsed status is
+        reused for 'status_ttl' seconds unless a command was run that may have moved a tape. Failed status
+        commands are not cached.
         """
+        if self.status_cache is not None and time.monotonic() - self.status_time < self.status_ttl:
+            return self.status_cache
+
         status      = self.run_mtx_command(["status"])
         parsed_data = self.parse_tape_library_output(status)
+
+        if not status.startswith("Error"):
+            self.status_cache = parsed_data
+            self.status_time  = time.monotonic()
         return parsed_data
 
 
@@ -114,8 +151,12 @@ class TapeLibraryOperations:
         information about data transfer elements (drives), it extracts details like
         the drive number, status, slot loaded, and volume tag. For storage elements
         (slots), it extracts the slot number, status, and volume tag. The method
-        also handles import/export slots similarly. Additionally, it maps the drive
-        names from the class's drive_name_mapping attribute to the parsed data.
+        also handles import/export slots similarly. Each drive is given its name from
+        the class's drive_name_mapping attribute as it is parsed.
+        Each line is matched once against the precompiled DRIVE_PATTERN and
+        SLOT_PATTERN; lines matching neither, like the header, are ignored.
+        A full drive whose source slot mtx does not know gets "Unknown" as
+        its slot_loaded.
 
         Example of output structure:
             {
@@ -132,28 +173,14 @@ class TapeLibraryOperations:
             "slots": {},
             "import_export_slots": {}
         }
-        lines = output.split('\n')
-        for line in lines:
-            if "Data Transfer Element" in line:
-                parts = line.split(':')
-                drive_number = parts[0].split()[3]
-                status = parts[1].split('(')[0].strip()
-                slot_loaded = parts[1].split('(')[1].split(')')[0].replace("Storage Element ", "").strip().split(' ')[0] if '(' in parts[1] else None
-                volume_tag = parts[2].split('=')[1].strip() if len(parts) > 2 and '=' in parts[2] else None
-                parsed_data["drives"][drive_number] = {"status": status, "slot_loaded": slot_loaded, "volume_tag": volume_tag}
-            elif "Storage Element" in line:
-                parts = line.split(':')
-                slot_number = parts[0].split()[2]
-                status = parts[1].split()[0].strip()
-                volume_tag = parts[2].split('=')[1].strip() if len(parts) > 2 and '=' in parts[2] else None
-                if "IMPORT/EXPORT" in line:
-                    parsed_data["import_export_slots"][slot_number] = {"status": status, "volume_tag": volume_tag}
-                else:
-                    parsed_data["slots"][slot_number] = {"status": status, "volume_tag": volume_tag}
-
-        for drive_number, drive_info in parsed_data["drives"].items():
-            drive_name = self.drive_name_mapping.get(drive_number, "Unknown")
-            drive_info["name"] = drive_name
+        for line in output.splitlines():
+            if match := DRIVE_PATTERN.match(line):
+                drive_number = match["number"]
+                parsed_data["drives"][drive_number] = {"status": match["status"], "slot_loaded": match["slot_loaded"] or match["unknown_slot"], "volume_tag": match["volume_tag"],
+                                                       "name": self.drive_name_mapping.get(drive_number, "Unknown")}
+            elif match := SLOT_PATTERN.match(line):
+                slots = "import_export_slots" if match["import_export"] else "slots"
+                parsed_data[slots][match["number"]] = {"status": match["status"], "volume_tag": match["volume_tag"]}
         return parsed_data
 
 
@@ -329,6 +356,43 @@ class TapeLibraryOperations:
         return result
 
 
+    def move_tapes(self, moves):
+        """
+        Moves several tapes between slots with a single mtx invocation.
+
+        Args:
+            moves (list): (slot_number_from, slot_number_to) pairs, executed in the given order.
+
+        Returns:
+            str: The output message from the mtx command, or a message naming the first move that cannot
+                 be done, in which case no tape is moved.
+
+        Note:
+        mtx accepts several commands on one command line and runs them in order, so the changer device
+        is opened once for all moves instead of once per move. The moves are checked against a single
+        status of the library, updated as each move is planned, so a slot emptied by one move can be
+        the target of a later one.
+        """
+        current_status = self.list_tapes()
+        occupancy = {slot: info.get('status') for slot, info in current_status['slots'].items()}
+
+        command = []
+        for slot_number_from, slot_number_to in moves:
+            slot_from, slot_to = str(slot_number_from), str(slot_number_to)
+            if occupancy.get(slot_from) == 'Empty':
+                return f"Source slot {slot_number_from} is empty. No tape to move."
+            if occupancy.get(slot_to) != 'Empty':
+                return f"Target slot {slot_number_to} is full. Cannot move tape."
+            occupancy[slot_from], occupancy[slot_to] = 'Empty', 'Full'
+            command.extend(["transfer", slot_from, slot_to])
+
+        if not command:
+            return "No tapes to move."
+
+        print(f"Moving {len(moves)} tapes: " + ", ".join(f"{slot_from} -> {slot_to}" for slot_from, slot_to in moves))
+        return self.run_mtx_command(command, verbose=True)
+
+
     def get_tape_label_from_drive(self, device_path):
         # Fetch the current status of the tape library
         tape_library_contents = self.list_tapes()
@@ -5,14 +5,33 @@ import typer
 import hashlib
 import os
 import signal
+import selectors
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pytp.config_manager import ConfigManager
 from pytp.tape_backup    import TapeBackup
 
-import fcntl
-import errno
-import time
 import re
 
+# Number of threads used by generate_checksums_batch; hashlib releases the GIL while hashing
+# and reading, so the files are read and hashed in parallel
+CHECKSUM_WORKERS     = os.cpu_count() or 1
+
+# Position fields of 'mt status', e.g. "File number=3, block number=0, partition=0." (mt-st writes the
+# second field in lower case, other mt implementations capitalize it)
+FILE_NUMBER_PATTERN  = re.compile(r"File number\s*=\s*(-?\d+)", re.IGNORECASE)
+BLOCK_NUMBER_PATTERN = re.compile(r"Block number\s*=\s*(-?\d+)", re.IGNORECASE)
+
+# Keywords of 'mt status' in order of precedence, with the readiness and the message for show_tape_status
+TAPE_STATES          = (
+    ("DR_OPEN",                 False, "The tape drive is empty (no tape loaded)."),
+    ("ONLINE",                  True,  None),
+    ("DRIVE NOT READY",         False, "The tape drive is not ready or has encountered an error"),
+    ("ERROR",                   False, "The tape drive is not ready or has encountered an error"),
+    ("Device or resource busy", False, "The tape drive is busy"),
+)
+TAPE_STATE_PATTERN   = re.compile("|".join(re.escape(keyword) for keyword, _, _ in TAPE_STATES))
+
 class TapeOperations:
     """
     TapeOperations class encapsulates various operations related to tape drives.
@@ -26,7 +45,7 @@ class TapeOperations:
         drive_name    (str): Name of the tape drive as configured in the system.
         device_path   (str): The file system path to the tape drive device.
         block_size    (int): The block size for tape operations, defaulting to 524288.
-        tar_dir       (str): The root directory for tar files used during operations.
+        tar_dir       (str or list): The root directory for tar files used during operations, or a list of them.
     """
 
     def __init__(self, drive_name, strategy="direct"):
@@ -105,7 +124,7 @@ class TapeOperations:
             return f"Error: {e.stderr}"
 
 
-    def is_tape_ready(self) -> bool:
+    def is_tape_ready(self, status_output: str = None) -> bool:
         """
         Checks if the tape drive is ready for operations.
 
@@ -113,6 +132,10 @@ class TapeOperations:
         if the tape is ready for read/write operations. It parses the output of the 'mt status'
         command to check for specific keywords that indicate the readiness of the drive.
 
+        Args:
+            status_output (str, optional): The output of an 'mt status' command the caller has just run.
+                                           If omitted, the status is queried.
+
         Returns:
             bool: True if the tape drive is ready, False otherwise.
 
@@ -124,19 +147,15 @@ class TapeOperations:
         This method contains example checks based on common status messages. These checks may need
         to be adjusted based on the specific responses of the tape drive in use.
         """
-        status_output = self.run_command(["status"])
+        if status_output is None:
+            status_output = self.run_command(["status"])
 
-        # Example checks (TODO: adjust these based on the tape drive's specific responses)
-        if "DR_OPEN" in status_output:
-            return False # "The tape drive is empty (no tape loaded)."
-        elif "ONLINE" in status_output:
-            return True  # Drive is ready
-        elif "DRIVE NOT READY" in status_output or "ERROR" in status_output:
-            return False  # Drive is not ready or has encountered an error
-        elif "Device or resource busy" in status_output:
-            return False # The tape drive is busy
-        
-        return False  # Default to not ready if none of the conditions match
+        # Find all keywords in one pass, then let the first one in TAPE_STATES decide
+        # (TODO: adjust the table based on the tape drive's specific responses)
+        found = set(TAPE_STATE_PATTERN.findall(status_output))
+
+        # Default to not ready if none of the keywords match
+        return next((ready for keyword, ready, _ in TAPE_STATES if keyword in found), False)
 
 
     def show_tape_status(self):
@@ -164,12 +183,10 @@ class TapeOperations:
         """
         status_output  = self.run_command(["status"])
 
-        if "DR_OPEN" in status_output:
-            return "The tape drive is empty (no tape loaded)."
-        elif "DRIVE NOT READY" in status_output or "ERROR" in status_output:
-            return "The tape drive is not ready or has encountered an error"
-        elif "Device or resource busy" in status_output:
-            return "The tape drive is busy"
+        found          = set(TAPE_STATE_PATTERN.findall(status_output))
+        message        = next((message for keyword, _, message in TAPE_STATES if message and keyword in found), None)
+        if message:
+            return message
 
         block_position = self.run_command(["tell"])
         status_output += block_position
@@ -182,7 +199,7 @@ class TapeOperations:
         return status_output
 
 
-    def show_tape_position(self):
+    def show_tape_position(self, status_output: str = None):
         """
         Retrieves and returns the current file number position of the tape.
 
@@ -191,6 +208,10 @@ class TapeOperations:
         is an indicator of the tape's position in terms of the number of file markers from 
         the beginning.
 
+        Args:
+            status_output (str, optional): The output of an 'mt status' command the caller has just run.
+                                           If omitted, the status is queried.
+
         Returns:
             int: The current file number position on the tape. If the file number is not found, 
                  it returns 0 as a default value.
@@ -204,22 +225,24 @@ class TapeOperations:
         The interpretation of the 'File number' line is dependent on the specific format and 
         responses of the 'mt status' command for the tape drive being used. It's essential to 
         ensure compatibility with your tape drive's response format.
+        The readiness check and the file number are taken from the same 'mt status' output,
+        so the status is queried only once.
         """
+        if status_output is None:
+            status_output = self.run_command(["status"])
+
         # Check if the drive is ready
-        if not self.is_tape_ready():
+        if not self.is_tape_ready(status_output):
             return "The tape drive is not ready."
         
-        status_output = self.run_command(["status"])
-        
-        file_number_line = next((line for line in status_output.split('\n') if "File number" in line), None)
-        if file_number_line:
-            file_number = file_number_line.split('=')[1].split(',')[0].strip()
-            return int(file_number)
+        match = FILE_NUMBER_PATTERN.search(status_output)
+        if match:
+            return int(match.group(1))
         else:
             return 0  # Default to 0 if file number is not found
 
 
-    def show_tape_block(self):
+    def show_tape_block(self, status_output: str = None):
         """
         Retrieves and returns the current block number position of the tape.
 
@@ -228,6 +251,10 @@ class TapeOperations:
         represents the tape's current position in terms of data blocks from the beginning 
         of the tape.
 
+        Args:
+            status_output (str, optional): The output of an 'mt status' command the caller has just run.
+                                           If omitted, the status is queried.
+
         Returns:
             int: The current block number position on the tape. If the block number is not 
                  found, it returns 0 as a default value.
@@ -242,18 +269,19 @@ class TapeOperations:
         The extraction and interpretation of the 'Block number' line depends on the 
         specific format and responses of the 'mt status' command for the tape drive in use. 
         As such, it's crucial to ensure that the method aligns with your tape drive's 
-        response format.
+        response format. The readiness check and the block number are taken from the same
+        'mt status' output, so the status is queried only once.
         """
+        if status_output is None:
+            status_output = self.run_command(["status"])
+
         # Check if the drive is ready
-        if not self.is_tape_ready():
+        if not self.is_tape_ready(status_output):
             return "The tape drive is not ready."
         
-        status_output = self.run_command(["status"])
-        
-        block_number_line = next((line for line in status_output.split('\n') if "Block number" in line), None)
-        if block_number_line:
-            block_number = block_number_line.split('=')[1].split(',')[0].strip()
-            return int(block_number)
+        match = BLOCK_NUMBER_PATTERN.search(status_output)
+        if match:
+            return int(match.group(1))
         else:
             return 0  # Default to 0 if block number is not found
 
@@ -297,7 +325,7 @@ class TapeOperations:
         return position
 
 
-    def rewind_tape(self, verbose: bool = True):
+    def rewind_tape(self, verbose: bool = True, check_ready: bool = True):
         """
         Rewinds the tape to the beginning.
 
@@ -309,6 +337,8 @@ class TapeOperations:
         Args:
             verbose (bool): If True, prints a message indicating the tape is being rewound.
                             Defaults to True.
+            check_ready (bool): If False, the readiness check is skipped, for callers that have just
+                                checked it themselves. Defaults to True.
 
         Returns:
             str: The output from the 'mt rewind' command, which is typically empty on success.
@@ -325,7 +355,7 @@ class TapeOperations:
         in a ready state for the next use.
         """
         # Check if the drive is ready
-        if not self.is_tape_ready():
+        if check_ready and not self.is_tape_ready():
             return "The tape drive is not ready."
 
         if verbose:
@@ -366,7 +396,7 @@ class TapeOperations:
             return "The tape drive is not ready."
 
         # Rewind the tape first
-        rewind_result = self.rewind_tape()
+        rewind_result = self.rewind_tape(check_ready=False)
         if "Error" in rewind_result:
             return rewind_result  # Return error message if rewind fails
 
@@ -403,11 +433,13 @@ class TapeOperations:
         backup and restore operations. It intelligently handles edge cases like 
         skipping beyond the start of the tape by automatically rewinding the tape.
         """
+        status_output = self.run_command(["status"])
+
         # Check if the drive is ready
-        if not self.is_tape_ready():
+        if not self.is_tape_ready(status_output):
             return "The tape drive is not ready."
 
-        current_position = self.show_tape_position()
+        current_position = self.show_tape_position(status_output)
         
         # Calculate the new position after the skip
         new_position = current_position + count
@@ -419,9 +451,9 @@ class TapeOperations:
             new_position -= 1
             real_count -= 1
 
-        # If new position is less than 1, perform a rewind instead of a backward skip
+        # If new position is less than 1, perform a rewind instead of a backward skip; readiness was checked above
         if new_position < 0:
-            return self.rewind_tape()
+            return self.rewind_tape(check_ready=False)
         else:
             if verbose:
                 typer.echo(f"Skipping {count} file markers from position {current_position} on {self.device_path}...")
@@ -452,12 +484,17 @@ class TapeOperations:
                                     number of files will be listed. Defaults to None.
 
         Note:
-        If a sample size is provided, the method will skip backward by one file 
+        If a sample size is provided, the method will stop tar and skip backward by one file 
         marker after listing the specified number of files. This is to ensure that 
         the tape head is positioned correctly for subsequent operations. If no 
         sample size is provided, the method will skip forward by one file marker 
         to move past the listed files. This ensures that the tape position is 
-        updated correctly and ready for further operations.
+        updated correctly and ready for further operations. If tar fails, the tape
+        is left where tar stopped, rather than moved by a marker it may not have reached.
+
+        The listing is passed on as raw bytes, in large chunks unless a sample is taken,
+        without decoding and printing it line by line; file names that are not valid in
+        the terminal's encoding are shown as they are stored.
         """
         # Check if the drive is ready
         if not self.is_tape_ready():
@@ -465,23 +502,41 @@ class TapeOperations:
             return ""
 
         command = ["tar", "-b", str(self.block_size), "-tvf", self.device_path]
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        # tar's messages go straight to the terminal; a pipe nobody reads could fill up and stall tar
+        process = subprocess.Popen(command, stdout=subprocess.PIPE)
+
+        sys.stdout.flush()  # Anything printed so far goes before the listing
+        output = sys.stdout.buffer
 
         line_count = 0
         try:
-            for line in process.stdout:
-                print(line, end='')  # Print each line immediately
-                line_count += 1
-                if sample and line_count >= sample:
-                    self.skip_file_markers(-1, False)
-                    break  # Stop after printing the specified number of sample lines
-                    
+            if sample:
+                for line in process.stdout:
+                    output.write(line)
+                    line_count += 1
+                    if line_count >= sample:
+                        output.flush()
+                        # Stop tar right away instead of letting it read on until its output pipe fills up,
+                        # and wait until it has closed the tape device, which mt needs to reposition the tape
+                        process.terminate()
+                        process.wait()
+                        self.skip_file_markers(-1, False)
+                        break  # Stop after printing the specified number of sample lines
+            else:
+                while chunk := process.stdout.read1(1 << 16):
+                    output.write(chunk)
+            output.flush()
+
         except Exception as e:
             print(f"Error while reading tape: {e}")
         finally:
             process.stdout.close()
             if not sample:
-                self.skip_file_markers(1, False)
+                process.wait()
+                if process.returncode == 0:
+                    self.skip_file_markers(1, False)
+                else:
+                    typer.echo(f"Error occurred while listing files. Error code: {process.returncode}")
 
 
     def backup_directories(self, directories: list, library_name = None, label = None, job = None, strategy="direct", incremental=False, max_concurrent_tars: int = 2, memory_buffer = 6, memory_buffer_percent = 40):
@@ -505,7 +560,8 @@ class TapeOperations:
             memory_buffer_percent (int, optional): The percentage of the memory buffer to be used. Default is 40%.
 
         Note:
-        This method sets up signal handling to ensure proper cleanup of temporary files in case of an interruption.
+        This method sets up signal handling so that an interruption stops the backup and the temporary files
+        are cleaned up once the worker threads have wound down.
         The actual backup process is delegated to the TapeBackup class's backup_directories method, which performs
         the backup according to the chosen strategy.
         """
@@ -516,7 +572,7 @@ class TapeOperations:
         tape_backup = TapeBackup(self, self.device_path, self.block_size, self.tar_dir, self.snapshot_dir, library_name, label, job, strategy, incremental, max_concurrent_tars, memory_buffer, memory_buffer_percent)
 
         # Set up signal handling
-        signal.signal(signal.SIGINT, lambda sig, frame: tape_backup.cleanup_temp_files())
+        signal.signal(signal.SIGINT, tape_backup.exit_handler)
 
         #tape_backup.backup_directories_memory_buffer(directories)
         tape_backup.backup_directories(directories)
@@ -538,7 +594,8 @@ class TapeOperations:
         for restoration. It uses the tar command with the block size and device path configured for the tape drive.
         During the process, it prints each line of the tar output immediately, providing live feedback.
         The method also handles exceptions gracefully, printing any errors encountered during the restoration.
-        After the process completes, it automatically advances the tape to the next file marker.
+        After the process completes successfully, it automatically advances the tape to the next file marker;
+        if it fails, the tape is left where tar stopped.
         """
         # Check if the drive is ready
         if not self.is_tape_ready():
@@ -557,54 +614,49 @@ class TapeOperations:
 
         print (command)
 
-        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
-        # Set the stdout and stderr to non-blocking
-        flags_stdout = fcntl.fcntl(process.stdout, fcntl.F_GETFL)
-        flags_stderr = fcntl.fcntl(process.stderr, fcntl.F_GETFL)
-        fcntl.fcntl(process.stdout, fcntl.F_SETFL, flags_stdout | os.O_NONBLOCK)
-        fcntl.fcntl(process.stderr, fcntl.F_SETFL, flags_stderr | os.O_NONBLOCK)
+        # Wait on both pipes at once, so that neither of them can fill up while the other is read,
+        # and handle whatever arrives as soon as it arrives
+        selector = selectors.DefaultSelector()
+        selector.register(process.stdout, selectors.EVENT_READ)
+        selector.register(process.stderr, selectors.EVENT_READ)
+        sys.stdout.flush()
 
         try:
-            while True:
-                # Read from stdout
-                try:
-                    output = process.stdout.readline()
-                    if output:
-                        print(output.strip())
-                except IOError as e:
-                    if e.errno != errno.EAGAIN and e.errno != errno.EWOULDBLOCK:
-                        raise
-
-                # Check stderr for the tape change prompt
-                try:
-                    error_output = process.stderr.readline()
-                    if error_output and "and hit return" in error_output:  # Adjust the message as per actual tar prompt
-                        print("Please change the tape and press Enter to continue...")
-                        input()  # Wait for user input
-                        # Send a SIGCONT signal to resume the tar process
-                        os.kill(process.pid, signal.SIGCONT)
-                    elif error_output:
-                        print(error_output.strip(), end='')
-                except IOError as e:
-                    if e.errno != errno.EAGAIN and e.errno != errno.EWOULDBLOCK:
-                        raise
-
-                if process.poll() is not None:
-                    break  # Process has finished
-
-                time.sleep(0.1)  # Avoid busy waiting
-
+            while selector.get_map():
+                for key, _ in selector.select():
+                    data = os.read(key.fd, 1 << 16)
+                    if not data:
+                        selector.unregister(key.fileobj)
+                    elif key.fileobj is process.stdout:
+                        sys.stdout.buffer.write(data)
+                        sys.stdout.buffer.flush()
+                    else:
+                        # Check stderr for the tape change prompt
+                        error_output = data.decode(errors="replace")
+                        if "and hit return" in error_output:  # Adjust the message as per actual tar prompt
+                            print("Please change the tape and press Enter to continue...")
+                            input()  # Wait for user input
+                            # Send a SIGCONT signal to resume the tar process
+                            os.kill(process.pid, signal.SIGCONT)
+                        else:
+                            print(error_output, end='', flush=True)
+
+            process.wait()
             if process.returncode != 0:
                 typer.echo(f"Error occurred during restore. Error code: {process.returncode}")
 
         except Exception as e:
             typer.echo(f"Error occurred during restore: {e}")
         finally:
+            selector.close()
             process.stdout.close()
             process.stderr.close()
-            self.skip_file_markers(1, False)
-            typer.echo(f"Restore of {target_dir} completed successfully.")
+            process.wait()
+            if process.returncode == 0:
+                self.skip_file_markers(1, False)
+                typer.echo(f"Restore of {target_dir} completed successfully.")
 
 
     def generate_checksum(self, file_path):
@@ -625,11 +677,42 @@ class TapeOperations:
         MD5 is chosen for its balance of speed and collision resistance in the context of file integrity checks.
         However, it's important to note that MD5 is not recommended for cryptographic purposes due to its
         vulnerabilities. In scenarios where security is critical, a more secure hash function like SHA-256
-        may be preferable.
+        may be preferable. The algorithm is kept as MD5 so that checksums remain comparable with
+        those generated before.
+
+        On Python 3.11 and later, hashlib.file_digest reads and hashes the file in C, releasing
+        the GIL while it does; otherwise the file is read in chunks of 1 MiB, so each update call
+        hashes a large block instead of a single page.
         """
-        hash_md5 = hashlib.md5()
         with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
+            if hasattr(hashlib, "file_digest"):
+                return hashlib.file_digest(f, "md5").hexdigest()
+
+            hash_md5 = hashlib.md5()
+            for chunk in iter(lambda: f.read(1 << 20), b""):
                 hash_md5.update(chunk)
         return hash_md5.hexdigest()
 
+
+    def generate_checksums_batch(self, file_paths):
+        """
+        Generates MD5 checksums for several files in parallel.
+
+        Each file is hashed by generate_checksum on one of CHECKSUM_WORKERS threads. Since reading
+        and hashing release the GIL, the reads of several files overlap, which makes use of the
+        aggregate bandwidth of RAID arrays and SSDs that a single sequential reader cannot reach.
+
+        Parameters:
+            file_paths (list): The paths to the files for which checksums are to be generated.
+
+        Returns:
+            dict: The MD5 checksum of each file as a hexadecimal string, keyed by its path.
+
+        Note:
+        If a file cannot be read, the exception of generate_checksum is raised once the results
+        are collected.
+        """
+        file_paths = list(file_paths)
+        with ThreadPoolExecutor(max_workers=CHECKSUM_WORKERS) as executor:
+            return dict(zip(file_paths, executor.map(self.generate_checksum, file_paths)))
+
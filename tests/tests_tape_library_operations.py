@@ -0,0 +1,56 @@
+# tests_tape_library_operations.py
+
+import unittest
+
+from pytp.tape_library_operations import TapeLibraryOperations
+
+
+class TestParseTapeLibraryOutput(unittest.TestCase):
+    """
+    Tests for TapeLibraryOperations.parse_tape_library_output, using lines as printed by 'mtx status'.
+    """
+
+    def setUp(self):
+        # The parser only needs the drive names, so the library configuration is not read
+        self.library = TapeLibraryOperations.__new__(TapeLibraryOperations)
+        self.library.drive_name_mapping = {"0": "lto6", "1": "lto9"}
+
+
+    def parse_drive(self, line):
+        return self.library.parse_tape_library_output(line)["drives"]["0"]
+
+
+    def test_empty_drive(self):
+        drive = self.parse_drive("Data Transfer Element 0:Empty")
+        self.assertEqual(drive, {"status": "Empty", "slot_loaded": None, "volume_tag": None, "name": "lto6"})
+
+
+    def test_full_drive_with_slot(self):
+        drive = self.parse_drive("Data Transfer Element 0:Full (Storage Element 2 Loaded):VolumeTag = ABC123L9")
+        self.assertEqual(drive, {"status": "Full", "slot_loaded": "2", "volume_tag": "ABC123L9", "name": "lto6"})
+
+
+    def test_full_drive_with_unknown_slot(self):
+        drive = self.parse_drive("Data Transfer Element 0:Full (Unknown Storage Element Loaded):VolumeTag = ABC123L9")
+        self.assertEqual(drive, {"status": "Full", "slot_loaded": "Unknown", "volume_tag": "ABC123L9", "name": "lto6"})
+
+
+    def test_status_output(self):
+        output = "\n".join([
+            "  Storage Changer /dev/sg1:2 Drives, 3 Slots ( 1 Import/Export )",
+            "Data Transfer Element 0:Empty",
+            "Data Transfer Element 1:Full (Storage Element 2 Loaded):VolumeTag = P0003SL9",
+            "      Storage Element 1:Full :VolumeTag=P0001SL9",
+            "      Storage Element 2:Empty",
+            "      Storage Element 3 IMPORT/EXPORT:Full :VolumeTag=P0002SL9",
+        ])
+        parsed = self.library.parse_tape_library_output(output)
+
+        self.assertEqual(parsed["drives"]["1"], {"status": "Full", "slot_loaded": "2", "volume_tag": "P0003SL9", "name": "lto9"})
+        self.assertEqual(parsed["slots"], {"1": {"status": "Full", "volume_tag": "P0001SL9"},
+                                           "2": {"status": "Empty", "volume_tag": None}})
+        self.assertEqual(parsed["import_export_slots"], {"3": {"status": "Full", "volume_tag": "P0002SL9"}})
+
+
+if __name__ == "__main__":
+    unittest.main()